@@ -6,7 +6,7 @@ import requests
 
 from datetime import datetime
 
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
@@ -16,6 +16,11 @@ from trueskill import TrueSkill, Rating, rate, expose
 from flask import Flask, request
 
 BOT_ID = os.environ['BOT_ID']
+# Number of weeks in a season before it is archived and a new one begins
+SEASON_LENGTH = os.environ.get('SEASON_LENGTH', '12')
+if not (SEASON_LENGTH.isdigit() and int(SEASON_LENGTH) >= 1):
+    raise ValueError("SEASON_LENGTH must be a whole number of weeks greater than 0, got: " + SEASON_LENGTH)
+SEASON_LENGTH = int(SEASON_LENGTH)
 
 def setup_db(db_name: str) -> None:
     conn = sqlite3.connect(db_name)
@@ -89,11 +94,75 @@ def setup_db(db_name: str) -> None:
     conn.commit()
     conn.close()
 
+def setup_season_tables(db_name: str) -> None:
+    # Created separately from setup_db so that existing databases pick up the
+    # season tables on startup without needing to be recreated
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS SEASON_STATS
+        (PLAYER_ID TEXT PRIMARY KEY NOT NULL,
+        GAMES_PLAYED INT NOT NULL,
+        TOTAL_SCORE INT NOT NULL,
+        AVERAGE_SCORE REAL NOT NULL,
+        NUM_1S INT DEFAULT 0,
+        NUM_2S INT DEFAULT 0,
+        NUM_3S INT DEFAULT 0,
+        NUM_4S INT DEFAULT 0,
+        NUM_5S INT DEFAULT 0,
+        NUM_6S INT DEFAULT 0,
+        NUM_XS INT DEFAULT 0);
+        ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS SEASON_NUMBER
+        (SEASON INT PRIMARY KEY NOT NULL,
+        START_WEEK INT NOT NULL);
+        ''')
+
+    # One row per finished week
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS WEEK_HISTORY
+        (WEEK INT PRIMARY KEY NOT NULL,
+        SEASON INT NOT NULL,
+        WINNERS TEXT NOT NULL,
+        AVERAGE_SCORE REAL NOT NULL,
+        PLAYERS INT NOT NULL);
+        ''')
+
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS WEEK_HISTORY_SEASON ON WEEK_HISTORY (SEASON);
+        ''')
+
+    # One row per player per finished season, with a snapshot of their rating
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS SEASON_HISTORY
+        (SEASON INT NOT NULL,
+        PLAYER_ID TEXT NOT NULL,
+        GAMES_PLAYED INT NOT NULL,
+        TOTAL_SCORE INT NOT NULL,
+        AVERAGE_SCORE REAL NOT NULL,
+        MU REAL NOT NULL,
+        SIGMA REAL NOT NULL,
+        PRIMARY KEY (SEASON, PLAYER_ID));
+        ''')
+
+    c.execute("SELECT EXISTS(SELECT 1 FROM SEASON_NUMBER);")
+    if (c.fetchall()[0][0] == 0):
+        c.execute("SELECT WEEK FROM WEEK_NUMBER;")
+        cur_week = c.fetchall()[0][0]
+        c.execute("INSERT INTO SEASON_NUMBER VALUES (1, ?);", (cur_week,))
+        # Season 1 includes the week in progress, so count its games so far
+        c.execute("INSERT INTO SEASON_STATS SELECT * FROM WEEKLY_STATS;")
+    conn.commit()
+    conn.close()
+
 db_name = "wordle.db"
 
 if not (os.path.exists(db_name)):
     print("Database does not exist. Creating new database.")
     setup_db(db_name)
+setup_season_tables(db_name)
 
 def send_message(text: str) -> None:
     text = text[:990]
@@ -261,6 +330,83 @@ def print_all_time_stats() -> None:
         idx = idx + 1
     send_message(msg)
 
+def get_season_number() -> Tuple[int, int]:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT SEASON,START_WEEK FROM SEASON_NUMBER;")
+    rows = c.fetchall()
+    conn.close()
+    return rows[0][0], rows[0][1]
+
+def get_week_history(season: int) -> str:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT WEEK,WINNERS,AVERAGE_SCORE FROM WEEK_HISTORY WHERE SEASON = ? ORDER BY WEEK;", (season,))
+    rows = c.fetchall()
+    conn.close()
+    msg = ""
+    for row in rows:
+        winners = ", ".join([get_name(player_id) for player_id in row[1].split(",")])
+        msg = msg + "Week " + str(row[0]) + ": " + winners + " (" + str(row[2])[:5] + "/6)\n"
+    return msg
+
+def print_current_season_stats() -> None:
+    season, start_week = get_season_number()
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT WEEK FROM WEEK_NUMBER;")
+    cur_week = c.fetchall()[0][0]
+    c.execute("SELECT * FROM SEASON_STATS;")
+    rows = c.fetchall()
+    conn.close()
+    rows = sorted(rows, key = lambda x: x[3])
+    msg = "Wordle Season " + str(season) + "\n"
+    # The season ends at the next week rollover if SEASON_LENGTH was lowered mid-season
+    season_week = min(cur_week - start_week + 1, SEASON_LENGTH)
+    msg = msg + "Week " + str(season_week) + " of " + str(SEASON_LENGTH) + "\n\n"
+    idx = 1
+    for row in rows:
+        msg = msg + str(idx) + ". " + get_name(row[0]) + "\n"
+        msg = msg + "Games played: " + str(row[1]) + "\n"
+        msg = msg + "Average score: " + str(row[3])[:5] + "/6\n\n"
+        idx = idx + 1
+    send_message(msg)
+    # Sent on its own so a long season's standings can't truncate it
+    week_history = get_week_history(season)
+    if (week_history):
+        send_message("Season " + str(season) + " weekly winners:\n\n" + week_history)
+
+def print_archived_season_stats(season: int) -> None:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT PLAYER_ID,GAMES_PLAYED,AVERAGE_SCORE,MU,SIGMA FROM SEASON_HISTORY WHERE SEASON = ? ORDER BY AVERAGE_SCORE;", (season,))
+    rows = c.fetchall()
+    conn.close()
+    if (not rows):
+        send_message("No stats available for season " + str(season) + ".")
+        return
+    msg = "Wordle Season " + str(season) + " (final)\n\n"
+    idx = 1
+    for row in rows:
+        rating = Rating(mu=row[3], sigma=row[4])
+        msg = msg + str(idx) + ". " + get_name(row[0]) + "\n"
+        msg = msg + "Games played: " + str(row[1]) + "\n"
+        msg = msg + "Average score: " + str(row[2])[:5] + "/6\n"
+        msg = msg + "TrueSkill: " + ('%.3f' % expose(rating)) + "\n\n"
+        idx = idx + 1
+    send_message(msg)
+    # Sent on its own so a long season's standings can't truncate it
+    week_history = get_week_history(season)
+    if (week_history):
+        send_message("Season " + str(season) + " weekly winners:\n\n" + week_history)
+
+def print_season_stats(season: Optional[int] = None) -> None:
+    cur_season, _ = get_season_number()
+    if (season is None or season == cur_season):
+        print_current_season_stats()
+    else:
+        print_archived_season_stats(season)
+
 def print_my_stats(player_id: str) -> None:
     if (personal_stats_available(player_id) == False):
         send_message("No stats available yet.")
@@ -319,6 +465,24 @@ def add_new_player_weekly(player_id: str) -> None:
     conn.commit()
     conn.close()
 
+def is_new_player_season(player_id: str) -> bool:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT EXISTS(SELECT 1 FROM SEASON_STATS WHERE PLAYER_ID = ?);", (player_id,))
+    rows = c.fetchall()
+    conn.close()
+    if (rows[0][0] == 0):
+        return True
+    else:
+        return False
+
+def add_new_player_season(player_id: str) -> None:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("INSERT INTO SEASON_STATS VALUES (?,0,0,0.0,0,0,0,0,0,0,0);", (player_id,))
+    conn.commit()
+    conn.close()
+
 def get_game_number_and_score(text: str) -> Tuple[int, int]:
     print(text)
     found = re.search("\d+", text)
@@ -329,44 +493,125 @@ def get_game_number_and_score(text: str) -> Tuple[int, int]:
         score = 7
     return int(game_number), int(score)
 
-def get_weekly_winners() -> Tuple[str, str]:
-    # Returns the player(s) with the highest average scores for the week
+def get_weekly_winners() -> Tuple[List[str], float]:
+    # Returns the player id(s) with the highest average scores for the week
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
     c.execute('SELECT PLAYER_ID,AVERAGE_SCORE FROM WEEKLY_STATS;')
     rows = c.fetchall()
     conn.close()
     highest_avg = min(rows, key = lambda x: x[1])[1]
-    winners = ""
+    winners = []
     for row in rows:
         if (row[1] == highest_avg):
-            winner_name = get_name(row[0])
-            winners = winners + winner_name + "\n"
-    return winners, str(highest_avg)
+            winners.append(row[0])
+    return winners, highest_avg
 
-def update_week_number() -> None:
+def get_season_winners() -> Tuple[List[str], float]:
+    # Returns the player id(s) with the highest average scores for the season
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
-    c.execute("SELECT WEEK FROM WEEK_NUMBER;")
+    c.execute('SELECT PLAYER_ID,AVERAGE_SCORE FROM SEASON_STATS;')
     rows = c.fetchall()
-    cur_week = rows[0][0] + 1
-    c.execute("UPDATE WEEK_NUMBER SET WEEK = ?;", (cur_week,))
-    conn.commit()
     conn.close()
-    msg = "Welcome to Wordle week " + str(cur_week) + "!\n\n"
-    if (stats_available() == True):
-        weekly_winners, avg_score = get_weekly_winners()
-        msg = msg + "Last week's winner(s):\n\n"
-        msg = msg + weekly_winners + "\nwith an average score of: " + avg_score[:5] + "/6"
-        send_message(msg)
+    highest_avg = min(rows, key = lambda x: x[1])[1]
+    winners = []
+    for row in rows:
+        if (row[1] == highest_avg):
+            winners.append(row[0])
+    return winners, highest_avg
+
+def weekly_stats_available() -> bool:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT EXISTS(SELECT 1 FROM WEEKLY_STATS);")
+    rows = c.fetchall()
+    conn.close()
+    if (rows[0][0] == 0):
+        return False
     else:
-        send_message("No stats available yet.")
+        return True
+
+def season_stats_available() -> bool:
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
+    c.execute("SELECT EXISTS(SELECT 1 FROM SEASON_STATS);")
+    rows = c.fetchall()
+    conn.close()
+    if (rows[0][0] == 0):
+        return False
+    else:
+        return True
+
+def archive_week(cur_week: int, season: int, winner_ids: List[str], avg_score: float) -> None:
+    # Advance the week, keep a one row summary of the finished week and clear
+    # WEEKLY_STATS in a single commit so a failure can't leave them out of step
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("UPDATE WEEK_NUMBER SET WEEK = ?;", (cur_week,))
+    if (winner_ids):
+        c.execute("SELECT COUNT(*) FROM WEEKLY_STATS;")
+        num_players = c.fetchall()[0][0]
+        c.execute("INSERT OR REPLACE INTO WEEK_HISTORY VALUES (?,?,?,?,?);", (cur_week - 1,season,",".join(winner_ids),avg_score,num_players,))
     c.execute("DELETE FROM WEEKLY_STATS;")
     conn.commit()
     conn.close()
 
+def archive_season(season: int, cur_week: int) -> None:
+    # Snapshot the season standings and player ratings, clear SEASON_STATS and
+    # start the next season in a single commit so the rollover can't run twice
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute('''
+        INSERT OR REPLACE INTO SEASON_HISTORY
+        SELECT ?, SEASON_STATS.PLAYER_ID, GAMES_PLAYED, TOTAL_SCORE, AVERAGE_SCORE, MU, SIGMA
+        FROM SEASON_STATS, PLAYER_RATINGS
+        WHERE PLAYER_RATINGS.PLAYER_ID = SEASON_STATS.PLAYER_ID;
+    ''', (season,))
+    c.execute("DELETE FROM SEASON_STATS;")
+    c.execute("UPDATE SEASON_NUMBER SET SEASON = ?, START_WEEK = ?;", (season + 1,cur_week,))
+    conn.commit()
+    conn.close()
+
+def update_season_number(cur_week: int) -> List[str]:
+    # Returns the announcement to send if a new season has started
+    season, start_week = get_season_number()
+    if (cur_week - start_week < SEASON_LENGTH):
+        return []
+    msg = "Welcome to Wordle season " + str(season + 1) + "!\n\n"
+    if (season_stats_available() == True):
+        season_winners, avg_score = get_season_winners()
+        msg = msg + "Season " + str(season) + " winner(s):\n\n"
+        for player_id in season_winners:
+            msg = msg + get_name(player_id) + "\n"
+        msg = msg + "\nwith an average score of: " + str(avg_score)[:5] + "/6"
+    else:
+        msg = msg + "No stats available for season " + str(season) + "."
+    archive_season(season, cur_week)
+    return [msg]
+
+def update_week_number() -> List[str]:
+    # Returns the announcements to send once the new day has been set up
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("SELECT WEEK FROM WEEK_NUMBER;")
+    rows = c.fetchall()
+    conn.close()
+    cur_week = rows[0][0] + 1
+    season, _ = get_season_number()
+    msg = "Welcome to Wordle week " + str(cur_week) + "!\n\n"
+    if (weekly_stats_available() == True):
+        weekly_winners, avg_score = get_weekly_winners()
+        msg = msg + "Last week's winner(s):\n\n"
+        for player_id in weekly_winners:
+            msg = msg + get_name(player_id) + "\n"
+        msg = msg + "\nwith an average score of: " + str(avg_score)[:5] + "/6"
+    else:
+        weekly_winners, avg_score = [], 0.0
+        msg = "No stats available yet."
+    archive_week(cur_week, season, weekly_winners, avg_score)
+    return [msg] + update_season_number(cur_week)
+
 def get_daily_winners() -> Tuple[str, str]:
     # Returns the player(s) with the highest score for the day
     conn = sqlite3.connect(db_name)
@@ -404,28 +649,36 @@ def update_game_number(game_number: int) -> None:
     if (game_number <= cur_game):
         return
 
-    # If it is Monday, update the week number
-    if (datetime.today().weekday() == 0):
-        update_week_number()
+    # Rate yesterday's game and advance the game number straight away so a
+    # failed announcement below can't cause the game to be rated twice. Rating
+    # before the week rollover means a season ending today snapshots ratings
+    # that include yesterday's game.
     update_player_rankings()
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
     c.execute("UPDATE GAME_NUMBER SET GAME = ?;", (game_number,))
     conn.commit()
     conn.close()
+    messages = []
+    # If it is Monday, update the week number
+    if (datetime.today().weekday() == 0):
+        messages = update_week_number()
     msg = "Welcome to Wordle " + str(game_number) + "!\n\n"
     if (stats_available() == True):
         daily_winners, score = get_daily_winners()
         msg = msg + "Yesterday's winner(s):\n\n"
         msg = msg + daily_winners + "\nwith a score of: " + score + "/6"
-        send_message(msg)
     else:
-        send_message("No stats available yet.")
+        msg = "No stats available yet."
+    messages.append(msg)
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
     c.execute("DELETE FROM DAILY_STATS;")
     conn.commit()
     conn.close()
+    # Only announce once the new day is fully set up
+    for msg in messages:
+        send_message(msg)
 
 def update_standings_daily(player_id: str, score: int) -> None:
     conn = sqlite3.connect(db_name)
@@ -457,6 +710,29 @@ def update_standings_all_time(player_id: str, score: int) -> None:
     conn.commit()
     conn.close()
 
+def update_standings_season(player_id: str, score: int) -> None:
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("UPDATE SEASON_STATS SET GAMES_PLAYED = GAMES_PLAYED + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    c.execute("UPDATE SEASON_STATS SET TOTAL_SCORE = TOTAL_SCORE + ? WHERE PLAYER_ID = ?;", (score,player_id,))
+    c.execute("UPDATE SEASON_STATS SET AVERAGE_SCORE = TOTAL_SCORE*1.0 / GAMES_PLAYED WHERE PLAYER_ID = ?;", (player_id,))
+    if (score == 1):
+        c.execute("UPDATE SEASON_STATS SET NUM_1S = NUM_1S + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    elif (score == 2):
+        c.execute("UPDATE SEASON_STATS SET NUM_2S = NUM_2S + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    elif (score == 3):
+        c.execute("UPDATE SEASON_STATS SET NUM_3S = NUM_3S + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    elif (score == 4):
+        c.execute("UPDATE SEASON_STATS SET NUM_4S = NUM_4S + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    elif (score == 5):
+        c.execute("UPDATE SEASON_STATS SET NUM_5S = NUM_5S + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    elif (score == 6):
+        c.execute("UPDATE SEASON_STATS SET NUM_6S = NUM_6S + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    elif (score == 7):
+        c.execute("UPDATE SEASON_STATS SET NUM_XS = NUM_XS + 1 WHERE PLAYER_ID = ?;", (player_id,))
+    conn.commit()
+    conn.close()
+
 def update_standings_weekly(player_id: str, score: int) -> None:
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
@@ -575,7 +851,11 @@ def process_score(message: str) -> None:
     if (is_new_player_weekly(message['sender_id']) == True):
         print("New player weekly. Adding player to table.")
         add_new_player_weekly(message['sender_id'])
-    # 7. Update the daily scores table
+    # 7. Check to see if player is new this season
+    if (is_new_player_season(message['sender_id']) == True):
+        print("New player this season. Adding player to table.")
+        add_new_player_season(message['sender_id'])
+    # 8. Update the daily scores table
     print("Updating daily score for player_id:", message['sender_id'], "score:", score)
     if (is_new_player_daily(message['sender_id']) == True):
         update_standings_daily(message['sender_id'], score)
@@ -587,12 +867,15 @@ def process_score(message: str) -> None:
         msg = msg + " has already submitted a score for today. Not submitting score."
         send_message(msg)
         return
-    # 8. Update the all time standings
+    # 9. Update the all time standings
     print("Updating all time standings for player_id:", message['sender_id'], "score:", score)
     update_standings_all_time(message['sender_id'], score)
-    # 9. Update the weekly standings
+    # 10. Update the weekly standings
     print("Updating weekly standings for player_id:", message['sender_id'], "score:", score)
     update_standings_weekly(message['sender_id'], score)
+    # 11. Update the season standings
+    print("Updating season standings for player_id:", message['sender_id'], "score:", score)
+    update_standings_season(message['sender_id'], score)
 
 def print_leaderboard():
     leaderboard = get_leaderboard()
@@ -618,6 +901,8 @@ help - show help menu
 daily - show daily stats
 weekly - show weekly stats
 all - show all time stats
+season - show current season stats
+season <#> - show a past season's final stats
 my - show personal stats
 leaderboard - show ranked leaderboard
 
@@ -640,6 +925,10 @@ def process_command(message: str) -> None:
         print_my_stats(message['sender_id'])
     elif (command == "leaderboard"):
         print_leaderboard()
+    elif (command == "season"):
+        print_season_stats()
+    elif (re.search("^season\s+\d+$", command)):
+        print_season_stats(int(command.split()[1]))
     else:
         print_help()
 